@@ -0,0 +1,72 @@
+# app/coalesce.py
+import os
+import json
+import time
+import hashlib
+import threading
+import urllib.parse
+from typing import Dict, Optional, Tuple, Any
+
+# How long (seconds) a finished run is served to identical requests
+COALESCE_TTL = int(os.getenv("COALESCE_TTL", 300))
+
+CACHEABLE_RESULTS = ("PASS", "FAIL")
+
+_lock = threading.Lock()
+_inflight: Dict[str, str] = {}                 # key -> job_id
+_recent: Dict[str, Tuple[float, str]] = {}     # key -> (finished_at, job_id)
+
+
+def normalize_url(url: str) -> str:
+    """Lower-case scheme/host, drop default ports, fragments and trailing slash, sort query"""
+    p = urllib.parse.urlsplit(url.strip())
+    scheme = p.scheme.lower()
+    host = (p.hostname or "").lower()
+    port = p.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    path = p.path.rstrip("/") or "/"
+    query = urllib.parse.urlencode(sorted(urllib.parse.parse_qsl(p.query, keep_blank_values=True)))
+    return urllib.parse.urlunsplit((scheme, host, path, query, ""))
+
+
+def request_key(url: str, form_index: int = 0, mapping: Optional[Dict[str, Any]] = None, **options) -> str:
+    """Stable key for (normalized URL, form index, mapping, run options)"""
+    raw = json.dumps([normalize_url(url), int(form_index), mapping or {}, options], sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def claim(key: str, job_id: str, force: bool = False) -> Tuple[str, Optional[str]]:
+    """
+    Register job_id as the run for key, unless an equivalent run exists.
+    Returns (job_id_to_use, reason) where reason is None for a new run,
+    "inflight" when attached to a running job, or "cached" for a fresh result.
+    """
+    now = time.time()
+    with _lock:
+        running = _inflight.get(key)
+        if running:
+            return running, "inflight"
+        if not force:
+            hit = _recent.get(key)
+            if hit and now - hit[0] <= COALESCE_TTL:
+                return hit[1], "cached"
+        _recent.pop(key, None)
+        _inflight[key] = job_id
+        return job_id, None
+
+
+def release(key: str, job_id: str, result: Optional[str] = None) -> None:
+    """
+    Mark the in-flight run for key as finished. Only PASS/FAIL results are
+    reused; errored runs (timeouts, browser crashes) are not cached.
+    """
+    now = time.time()
+    with _lock:
+        if _inflight.get(key) == job_id:
+            del _inflight[key]
+        if result in CACHEABLE_RESULTS:
+            _recent[key] = (now, job_id)
+        # prune expired entries so the table does not grow without bound
+        for k in [k for k, (ts, _) in _recent.items() if now - ts > COALESCE_TTL]:
+            del _recent[k]
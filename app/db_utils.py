@@ -63,3 +63,42 @@ def query_jobs(search: Optional[str] = None, limit: int = 50) -> List[Dict]:
             }
         )
     return out
+
+PERF_DDL = """
+CREATE TABLE IF NOT EXISTS perf_history (
+    job_id TEXT PRIMARY KEY,
+    host TEXT,
+    timestamp TEXT,
+    metrics TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_perf_host_ts ON perf_history (host, timestamp);
+"""
+
+def ensure_perf_table():
+    """Create the perf_history table if missing (called once at startup)"""
+    conn = get_conn()
+    conn.executescript(PERF_DDL)
+    conn.close()
+
+def save_perf_sample(job_id: str, host: str, timestamp: str, metrics: Dict):
+    """Store one run's performance summary for per-host trends"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT OR REPLACE INTO perf_history (job_id,host,timestamp,metrics) VALUES (?,?,?,?)",
+        (job_id, host, timestamp, json.dumps(metrics)),
+    )
+    conn.commit()
+    conn.close()
+
+def query_perf_trend(host: str, limit: int = 50) -> List[Dict]:
+    """Recent performance summaries for a host, newest first"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute(
+        "SELECT job_id,timestamp,metrics FROM perf_history WHERE host = ? ORDER BY timestamp DESC LIMIT ?",
+        (host, limit),
+    )
+    rows = cur.fetchall()
+    conn.close()
+    return [{"job_id": r[0], "timestamp": r[1], **json.loads(r[2])} for r in rows]
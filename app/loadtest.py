@@ -0,0 +1,183 @@
+# app/loadtest.py
+import re
+import math
+import time
+import base64
+import asyncio
+import urllib.parse
+from typing import Dict, Any, List, Optional, Tuple
+
+# Headers the HTTP client sets itself (or that only make sense once)
+DROP_HEADERS = {"host", "content-length", "connection", "keep-alive", "transfer-encoding", "accept-encoding"}
+NONCE_RE = re.compile(r"nonce|token|^_wp|^_wpcf7", re.I)
+MULTIPART_FIELD_RE = re.compile(rb'name="([^"]+)"\r\n\r\n([^\r]*)\r\n')
+# Application-level "status" values in a JSON reply that mean the submission
+# went through (CF7 REST returns HTTP 200 with validation_failed/spam/mail_failed)
+OK_APP_STATUSES = {"mail_sent", "ok", "success"}
+
+
+def app_status(resp) -> Optional[str]:
+    """
+    Application-level failure in a JSON response body, e.g. CF7's
+    {"status": "spam"} or WPForms' {"success": false}; None if it looks fine
+    or the body isn't JSON.
+    """
+    if "json" not in resp.headers.get("content-type", ""):
+        return None
+    try:
+        data = resp.json()
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    status = data.get("status")
+    if isinstance(status, str) and status not in OK_APP_STATUSES:
+        return status
+    if data.get("success") is False:
+        return "success_false"
+    return None
+
+
+def nonce_fields(body: bytes, content_type: str) -> Dict[str, str]:
+    """Form fields that look like nonces/tokens (e.g. _wpcf7, _wpnonce)"""
+    if "multipart/form-data" in content_type:
+        pairs = [(k.decode("utf-8", "replace"), v.decode("utf-8", "replace")) for k, v in MULTIPART_FIELD_RE.findall(body)]
+    elif "application/x-www-form-urlencoded" in content_type:
+        pairs = urllib.parse.parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True)
+    else:
+        return {}
+    return {k: v for k, v in pairs if NONCE_RE.search(k)}
+
+
+def _body_fields(body: bytes, field_names: List[str]) -> List[str]:
+    """Filled field names that appear in a request body (multipart, urlencoded or JSON)"""
+    found = []
+    for name in field_names:
+        raw = name.encode("utf-8")
+        needles = (b'name="' + raw + b'"', urllib.parse.quote_plus(name).encode("ascii") + b"=", b'"' + raw + b'"')
+        if any(n in body for n in needles):
+            found.append(name)
+    return found
+
+
+def pick_submit_request(requests: List[Any], action_url: str, field_names: List[str]) -> Tuple[Optional[Any], str]:
+    """
+    Choose the form's submission among non-GET requests seen after the click:
+    one whose body carries the most filled fields, else one sent to the
+    form's action URL. Returns (request, reason); request is None if nothing matches.
+    """
+    best, best_fields = None, []
+    for req in requests:
+        fields = _body_fields(req.post_data_buffer or b"", field_names)
+        if len(fields) > len(best_fields):
+            best, best_fields = req, fields
+    if best is not None:
+        return best, "body contains filled fields: " + ", ".join(best_fields)
+    action = urllib.parse.urldefrag(action_url or "")[0]
+    for req in requests:
+        if action and urllib.parse.urldefrag(req.url)[0] == action:
+            return req, "url matches form action"
+    return None, f"no request matched form action or filled fields ({len(requests)} non-GET seen)"
+
+
+def capture_request(req) -> Dict[str, Any]:
+    """Serializable copy of a Playwright Request for later replay"""
+    try:
+        headers = req.all_headers()
+    except Exception:
+        headers = req.headers
+    headers = {k: v for k, v in headers.items() if not k.startswith(":") and k.lower() not in DROP_HEADERS}
+    body = req.post_data_buffer or b""
+    content_type = next((v for k, v in headers.items() if k.lower() == "content-type"), "")
+    return {
+        "method": req.method,
+        "url": req.url,
+        "headers": headers,
+        "body_b64": base64.b64encode(body).decode("ascii"),
+        "nonce_fields": nonce_fields(body, content_type),
+    }
+
+
+def percentile(sorted_vals: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_vals:
+        return None
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_vals)))
+    return sorted_vals[min(rank, len(sorted_vals)) - 1]
+
+
+async def replay(captured: Dict[str, Any], rate: float, concurrency: int, total: int, timeout: float = 30.0) -> Dict[str, Any]:
+    """
+    Send `total` copies of a captured request at `rate` per second with at
+    most `concurrency` in flight over pooled connections. HTTP >= 400 and
+    application failures in JSON replies both count as errors; the latter
+    are also counted in app_errors and keyed "<code>:<status>" in statuses.
+    """
+    import httpx
+
+    body = base64.b64decode(captured.get("body_b64", ""))
+    latencies: List[float] = []
+    statuses: Dict[str, int] = {}
+    errors = 0
+    app_errors = 0
+    sem = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout, follow_redirects=False) as client:
+        async def one():
+            nonlocal errors, app_errors
+            try:
+                t = time.perf_counter()
+                r = await client.request(captured["method"], captured["url"], headers=captured.get("headers"), content=body)
+                latencies.append((time.perf_counter() - t) * 1000)
+                key = str(r.status_code)
+                if r.status_code >= 400:
+                    errors += 1
+                else:
+                    failed = app_status(r)
+                    if failed:
+                        errors += 1
+                        app_errors += 1
+                        key = f"{key}:{failed}"
+            except Exception as e:
+                errors += 1
+                key = type(e).__name__
+            finally:
+                sem.release()
+            statuses[key] = statuses.get(key, 0) + 1
+
+        start = time.perf_counter()
+        tasks = []
+        for i in range(total):
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await sem.acquire()
+            tasks.append(asyncio.create_task(one()))
+        await asyncio.gather(*tasks)
+        duration = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "target": captured["url"],
+        "requested": total,
+        "rate": rate,
+        "concurrency": concurrency,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(total / duration, 2) if duration else None,
+        "errors": errors,
+        "app_errors": app_errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "statuses": statuses,
+        "latency_ms": {
+            "p50": _round(percentile(latencies, 50)),
+            "p90": _round(percentile(latencies, 90)),
+            "p95": _round(percentile(latencies, 95)),
+            "p99": _round(percentile(latencies, 99)),
+            "max": _round(latencies[-1] if latencies else None),
+        },
+    }
+
+
+def _round(v: Optional[float]) -> Optional[float]:
+    return None if v is None else round(v, 1)
@@ -1,30 +1,40 @@
 import os
 import json
 import uuid
+import math
 import time
 import threading
 import datetime
 import urllib.parse
 import smtplib
+from contextlib import asynccontextmanager
 from email.message import EmailMessage
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse, HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from playwright.sync_api import sync_playwright
 
 # Optional DB helper (safe to skip)
 try:
-    from app.db_utils import save_job_record
+    from app.db_utils import save_job_record, save_perf_sample, query_perf_trend, ensure_perf_table
 except Exception:
     def save_job_record(_): pass
+    def ensure_perf_table(): pass
+    def save_perf_sample(*_): pass
+    def query_perf_trend(*_): return []
+
+from app.coalesce import request_key, claim, release
+from app.steps import StepLog
+from app.visual import compare_screenshot, accept_baseline
+from app.perf import PerfCapture, PERF_CAPTURE
+from app.loadtest import capture_request, pick_submit_request, replay
 
 # Windows event loop fix
 import sys
+import asyncio
 if sys.platform == "win32":
-    import asyncio
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
 # --- CONFIG ---
@@ -38,19 +48,72 @@ ROOT = os.getcwd()
 ARTIFACT_DIR = os.path.join(ROOT, "artifacts")
 TEMPLATES_DIR = os.path.join(ROOT, "templates_data")
 REPORTS_DIR = os.path.join(ROOT, "reports")
-os.makedirs(ARTIFACT_DIR, exist_ok=True)
-os.makedirs(TEMPLATES_DIR, exist_ok=True)
-os.makedirs(REPORTS_DIR, exist_ok=True)
-
-app = FastAPI(title="Form Tester – Final Phase 1")
-app.mount("/artifacts", StaticFiles(directory=ARTIFACT_DIR), name="artifacts")
-app.mount("/reports", StaticFiles(directory=REPORTS_DIR), name="reports")
+WARM_UP = os.getenv("WARM_UP", "1") == "1"
+WARM_UP_MAX_BACKOFF = int(os.getenv("WARM_UP_MAX_BACKOFF", 60))
+LOAD_MAX_TOTAL = int(os.getenv("LOAD_MAX_TOTAL", 1000))
+LOAD_MAX_CONCURRENCY = int(os.getenv("LOAD_MAX_CONCURRENCY", 50))
+LOAD_MIN_RATE = float(os.getenv("LOAD_MIN_RATE", 0.1))
+LOAD_MAX_DURATION = int(os.getenv("LOAD_MAX_DURATION", 3600))  # seconds of pacing per load job
+
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    os.makedirs(ARTIFACT_DIR, exist_ok=True)
+    os.makedirs(TEMPLATES_DIR, exist_ok=True)
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    try:
+        ensure_perf_table()
+    except Exception as e:
+        print("ensure_perf_table failed:", e)
+    if WARM_UP:
+        threading.Thread(target=warm_up_until_ready, daemon=True).start()
+    else:
+        warm_state["ready"] = True
+    yield
+
+
+app = FastAPI(title="Form Tester – Final Phase 1", lifespan=lifespan)
+# Directories are created in lifespan(), so don't check them at import
+app.mount("/artifacts", StaticFiles(directory=ARTIFACT_DIR, check_dir=False), name="artifacts")
+app.mount("/reports", StaticFiles(directory=REPORTS_DIR, check_dir=False), name="reports")
 templates = Jinja2Templates(directory=os.path.join("app", "templates"))
 
 jobs: Dict[str, Dict[str, Any]] = {}
 
+# Browser warm-up state reported by /ready
+warm_state: Dict[str, Any] = {"ready": False, "started": None, "seconds": None, "error": None, "attempts": 0}
+
+DEFAULT_MAPPING = {
+    "first_name": "Test User",
+    "your-name": "Test User",
+    "name": "Test User",
+    "email": "test@example.com",
+    "your-email": "test@example.com",
+    "phone": "+1-202-555-0198",
+    "message": "Automated message"
+}
+
+SUCCESS_SELECTOR = ".wpcf7-mail-sent-ok, .wpforms-confirmation-container"
+SUCCESS_TEXTS = ["thank you", "message sent", "successfully sent"]
+
 
 # --- HELPERS ---
+def parse_mapping(mapping: Optional[str]) -> Dict[str, str]:
+    """Parse the `mapping` query param (JSON object of field name -> value)"""
+    try:
+        mapping_dict = json.loads(mapping) if mapping else {}
+    except ValueError as e:
+        raise ValueError(f"Invalid mapping: {e}")
+    if not isinstance(mapping_dict, dict):
+        raise ValueError("Invalid mapping: mapping must be a JSON object")
+    return mapping_dict
+
+
+def steps_list(job: Dict[str, Any], compact: bool = False) -> list:
+    steps = job.get("steps", [])
+    return steps.to_list(compact) if isinstance(steps, StepLog) else list(steps)
+
+
 def safe_filename(s: str) -> str:
     return "".join(c if c.isalnum() or c in ("-", ".") else "_" for c in s)
 
@@ -68,6 +131,20 @@ def take_screenshot(page, job_id: str, tag: str) -> str:
     return f"/artifacts/{fname}"
 
 
+def visual_check(job: Dict[str, Any], tag: str, shot: str) -> None:
+    """Diff a screenshot against the host/form baseline and record the result"""
+    local = os.path.join(ARTIFACT_DIR, os.path.basename(shot))
+    try:
+        res = compare_screenshot(job["job_id"], job["url"], job.get("form_index", 0), tag, local)
+    except Exception as e:
+        job["steps"].append({"action": "visual_error", "field": tag, "error": str(e)})
+        return
+    if res:
+        job.setdefault("visual", {})[tag] = res
+        if res.get("diff"):
+            job["artifacts"].append(res["diff"])
+
+
 def send_result_email(job: Dict[str, Any]) -> Dict[str, Any]:
     """Send report + screenshots via email"""
     if not (SMTP_USER and SMTP_PASS and NOTIFY_TO):
@@ -128,7 +205,11 @@ def save_html_report(job: Dict[str, Any]) -> str:
         ]
         parts.append(f"<h1>Form Test — {job.get('result')}</h1>")
         parts.append(f"<div class='card'><b>URL:</b> {job.get('url')}<br><b>Job:</b> {job_id}<br><b>Time:</b> {job.get('timestamp')}</div>")
-        parts.append("<h3>Steps</h3><pre>" + json.dumps(job.get("steps", []), indent=2) + "</pre>")
+        parts.append("<h3>Steps</h3><pre>" + json.dumps(steps_list(job), indent=2) + "</pre>")
+        if job.get("visual"):
+            parts.append("<h3>Visual Diff</h3><pre>" + json.dumps(job["visual"], indent=2) + "</pre>")
+        if job.get("load"):
+            parts.append("<h3>Load Test</h3><pre>" + json.dumps(job["load"], indent=2) + "</pre>")
         parts.append("<h3>Screenshots</h3>")
         for a in job.get("artifacts", []):
             parts.append(f"<div class='card'><a href='{a}'>{a}</a><br><img src='{a}' style='max-width:700px;border:1px solid #ccc;'/></div>")
@@ -141,15 +222,52 @@ def save_html_report(job: Dict[str, Any]) -> str:
         return ""
 
 
+def warm_up() -> None:
+    """Start the Playwright driver, launch Chromium and load a blank page once"""
+    warm_state["started"] = time.time()
+    warm_state["attempts"] += 1
+    try:
+        from playwright.sync_api import sync_playwright
+        with sync_playwright() as pw:
+            browser = pw.chromium.launch(headless=True)
+            page = browser.new_page()
+            page.goto("about:blank")
+            browser.close()
+        warm_state["error"] = None
+        warm_state["ready"] = True
+    except Exception as e:
+        print("warm_up failed:", e)
+        warm_state["error"] = str(e)
+    finally:
+        warm_state["seconds"] = round(time.time() - warm_state["started"], 2)
+
+
+def warm_up_until_ready() -> None:
+    """Retry warm_up() with exponential backoff so a transient launch failure doesn't stick"""
+    delay = 2
+    while True:
+        warm_up()
+        if warm_state["ready"]:
+            return
+        time.sleep(delay)
+        delay = min(delay * 2, WARM_UP_MAX_BACKOFF)
+
+
 # --- MAIN BACKGROUND TEST THREAD ---
-def background_test(job_id: str, url: str, form_index: int = 0):
+def background_test(job_id: str, url: str, form_index: int = 0, mapping: Optional[Dict[str, str]] = None,
+                    capture_perf: bool = False, capture_submit: bool = False,
+                    visual: bool = True, notify: bool = True):
     job = jobs[job_id]
     start_ts = time.time()
+    # In capture mode the job stays RUNNING until the load replay is done
+    result_key = "capture_result" if capture_submit else "result"
 
     try:
+        from playwright.sync_api import sync_playwright
         with sync_playwright() as pw:
             browser = pw.chromium.launch(headless=True)
             page = browser.new_page()
+            perf = PerfCapture(page) if capture_perf else None
 
             # Go to URL
             job["steps"].append({"action": "navigate", "status": "running"})
@@ -158,12 +276,17 @@ def background_test(job_id: str, url: str, form_index: int = 0):
             except Exception:
                 page.goto(url, wait_until="domcontentloaded", timeout=30000)
             job["steps"].append({"action": "navigate_done", "status": "ok"})
+            if perf:
+                perf.snapshot("load")
+                job["perf"] = perf.result()
             job["progress"] = 10
 
             # Screenshot & dump HTML
             try:
                 shot = take_screenshot(page, job_id, "nav")
                 job["artifacts"].append(shot)
+                if visual:
+                    visual_check(job, "nav", shot)
                 dump = os.path.join(REPORTS_DIR, f"{job_id}_form_debug.html")
                 with open(dump, "w", encoding="utf-8") as f:
                     f.write(page.content())
@@ -185,11 +308,12 @@ def background_test(job_id: str, url: str, form_index: int = 0):
 
             if not forms:
                 job["steps"].append({"action": "no_forms", "status": "fail"})
-                job["result"] = "FAIL"
+                job[result_key] = "FAIL"
                 job["progress"] = 100
                 job["elapsed"] = round(time.time() - start_ts, 2)
                 job["report"] = save_html_report(job)
-                send_result_email(job)
+                if notify:
+                    send_result_email(job)
                 return
 
             form = forms[form_index] if len(forms) > form_index else forms[0]
@@ -205,17 +329,10 @@ def background_test(job_id: str, url: str, form_index: int = 0):
             job["steps"].append({"action": "form_details", "fields": form_details})
 
             # Fill fields
-            mapping = {
-                "first_name": "Test User",
-                "your-name": "Test User",
-                "name": "Test User",
-                "email": "test@example.com",
-                "your-email": "test@example.com",
-                "phone": "+1-202-555-0198",
-                "message": "Automated message"
-            }
+            mapping = {**DEFAULT_MAPPING, **(mapping or {})}
 
             filled = 0
+            filled_names = []
             for fld in form_details:
                 fname = fld.get("name")
                 if not fname:
@@ -231,6 +348,7 @@ def background_test(job_id: str, url: str, form_index: int = 0):
                             page.evaluate("(e,v)=>{e.value=v; e.dispatchEvent(new Event('input',{bubbles:true}))}", el, value)
                         step["status"] = "ok"
                         filled += 1
+                        filled_names.append(fname)
                     else:
                         step["status"] = "not_found"
                 except Exception as e:
@@ -243,10 +361,20 @@ def background_test(job_id: str, url: str, form_index: int = 0):
             try:
                 shot2 = take_screenshot(page, job_id, "after_fill")
                 job["artifacts"].append(shot2)
+                if visual:
+                    visual_check(job, "after_fill", shot2)
             except Exception as e:
                 job["steps"].append({"action": "screenshot_after_fill_error", "error": str(e)})
 
             # Submit
+            if perf:
+                perf.mark_submit()
+            submit_requests = []
+            if capture_submit:
+                # read before clicking: a navigating submit detaches the form handle
+                action_url = form.evaluate("(f)=>f.action")
+                page.on("request", lambda r: submit_requests.append(r)
+                        if r.method != "GET" and r.resource_type in ("xhr", "fetch", "document") else None)
             try:
                 btn = form.query_selector("button[type='submit'], input[type='submit'], button:not([type])")
                 if btn:
@@ -260,15 +388,27 @@ def background_test(job_id: str, url: str, form_index: int = 0):
             job["progress"] = 80
 
             # Wait and detect success
-            page.wait_for_timeout(3000)
+            if perf:
+                perf.wait_for_confirmation(SUCCESS_SELECTOR, SUCCESS_TEXTS, 3000)
+                perf.snapshot("submit")
+                job["perf"] = perf.result()
+            else:
+                page.wait_for_timeout(3000)
+            if capture_submit:
+                req, reason = pick_submit_request(submit_requests, action_url, filled_names)
+                if req:
+                    job["captured_request"] = capture_request(req)
+                    job["steps"].append({"action": "capture_submit", "status": "ok", "field": req.url, "reason": reason})
+                else:
+                    job["steps"].append({"action": "capture_submit", "status": "not_found", "reason": reason})
             success = False
             try:
-                if page.query_selector(".wpcf7-mail-sent-ok, .wpforms-confirmation-container"):
+                if page.query_selector(SUCCESS_SELECTOR):
                     success = True
                     job["steps"].append({"action": "detect_success", "status": "ok"})
                 else:
                     body = page.inner_text("body").lower()
-                    if any(w in body for w in ["thank you", "message sent", "successfully sent"]):
+                    if any(w in body for w in SUCCESS_TEXTS):
                         success = True
                         job["steps"].append({"action": "detect_text_success", "status": "ok"})
             except Exception as e:
@@ -278,16 +418,18 @@ def background_test(job_id: str, url: str, form_index: int = 0):
             try:
                 shot3 = take_screenshot(page, job_id, "after_submit")
                 job["artifacts"].append(shot3)
+                if visual:
+                    visual_check(job, "after_submit", shot3)
             except Exception:
                 pass
 
             browser.close()
-            job["progress"] = 100
-            job["result"] = "PASS" if success else "FAIL"
+            job["progress"] = 90 if capture_submit else 100
+            job[result_key] = "PASS" if success else "FAIL"
 
     except Exception as e:
         job["steps"].append({"action": "exception", "error": str(e)})
-        job["result"] = "ERROR"
+        job[result_key] = "ERROR"
     finally:
         job["elapsed"] = round(time.time() - start_ts, 2)
         job["timestamp"] = datetime.datetime.utcnow().isoformat()
@@ -295,6 +437,45 @@ def background_test(job_id: str, url: str, form_index: int = 0):
             job["report"] = save_html_report(job)
         except Exception:
             job["report"] = None
+        if job.get("perf"):
+            try:
+                host = urllib.parse.urlparse(url).hostname or "site"
+                save_perf_sample(job_id, host, job["timestamp"], job["perf"]["summary"])
+            except Exception as e:
+                job["steps"].append({"action": "perf_store_error", "error": str(e)})
+        if notify:
+            try:
+                send_result_email(job)
+            except Exception as e:
+                job["steps"].append({"action": "email_error", "error": str(e)})
+        if job.get("dedupe_key"):
+            release(job["dedupe_key"], job_id, job.get("result"))
+
+
+def background_load_test(job_id: str, url: str, form_index: int, mapping: Dict[str, str],
+                         rate: float, concurrency: int, total: int):
+    """
+    Run the browser flow once to capture the submit request, then replay it
+    without a browser. Capture skips visual checks and email; the report is
+    sent once the load results are in.
+    """
+    background_test(job_id, url, form_index, mapping, capture_submit=True, visual=False, notify=False)
+    job = jobs[job_id]
+    try:
+        captured = job.get("captured_request")
+        if not captured:
+            job["load"] = {"status": "skipped", "error": "no submit request captured"}
+            return
+        job["load"] = {"status": "running"}
+        job["load"] = {"status": "done", **asyncio.run(replay(captured, rate, concurrency, total))}
+    except Exception as e:
+        job["load"] = {"status": "error", "error": str(e)}
+        job["steps"].append({"action": "load_error", "error": str(e)})
+    finally:
+        capture = job.get("capture_result", "ERROR")
+        job["result"] = "ERROR" if job.get("load", {}).get("status") == "error" else capture
+        job["progress"] = 100
+        job["report"] = save_html_report(job)
         try:
             send_result_email(job)
         except Exception as e:
@@ -307,44 +488,149 @@ def ping():
     """Simple health check used by Render and for quick debugging."""
     return {"status": "ok", "time": datetime.datetime.utcnow().isoformat()}
 
+
+@app.get("/ready")
+def ready():
+    """Readiness probe: 200 once the browser warm-up has succeeded, 503 before"""
+    body = {"ready": warm_state["ready"], "warm_up_seconds": warm_state["seconds"],
+            "attempts": warm_state["attempts"], "error": warm_state["error"]}
+    return JSONResponse(body, status_code=200 if warm_state["ready"] else 503)
+
 @app.get("/", response_class=HTMLResponse)
 def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 
 @app.get("/run_template_async")
-def run_template_async(url: str):
+def run_template_async(url: str, form_index: int = 0, mapping: Optional[str] = None, force: bool = False,
+                       perf: Optional[bool] = None):
+    """
+    Start a form test. Identical requests (same normalized URL, form index,
+    mapping and perf option) attach to the running job, or get the last
+    result while it is fresh (COALESCE_TTL), unless force=true.
+    perf=true records target-site performance (default: PERF_CAPTURE).
+    """
+    if not url.startswith(("http://", "https://")):
+        return JSONResponse({"error": "Invalid URL"}, status_code=400)
+    try:
+        mapping_dict = parse_mapping(mapping)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    capture_perf = PERF_CAPTURE if perf is None else perf
+    key = request_key(url, form_index, mapping_dict, perf=capture_perf)
+    job_id = uuid.uuid4().hex[:10]
+    # Register the job before claiming, so an attached duplicate never sees a 404
+    jobs[job_id] = {
+        "job_id": job_id,
+        "url": url,
+        "progress": 0,
+        "steps": StepLog(),
+        "artifacts": [],
+        "result": "RUNNING",
+        "start": time.time(),
+        "form_index": form_index,
+        "dedupe_key": key,
+    }
+    existing, reason = claim(key, job_id, force=force)
+    if reason == "cached" and existing not in jobs:
+        existing, reason = claim(key, job_id, force=True)
+    if reason:
+        del jobs[job_id]
+        return {"job_id": existing, "coalesced": reason}
+
+    threading.Thread(target=background_test, args=(job_id, url, form_index, mapping_dict, capture_perf), daemon=True).start()
+    return {"job_id": job_id}
+
+
+@app.get("/run_load_test")
+def run_load_test(url: str, rate: float = 5.0, concurrency: int = 10, total: int = 50,
+                  form_index: int = 0, mapping: Optional[str] = None):
+    """
+    Capture the form's real submit request with one browser run, then replay
+    it `total` times at `rate` req/s with up to `concurrency` in flight.
+    """
     if not url.startswith(("http://", "https://")):
         return JSONResponse({"error": "Invalid URL"}, status_code=400)
+    if (not math.isfinite(rate) or rate < LOAD_MIN_RATE or total / rate > LOAD_MAX_DURATION
+            or not (1 <= concurrency <= LOAD_MAX_CONCURRENCY) or not (1 <= total <= LOAD_MAX_TOTAL)):
+        return JSONResponse({"error": f"rate must be finite and >= {LOAD_MIN_RATE}, total/rate <= {LOAD_MAX_DURATION}s, "
+                                      f"concurrency 1-{LOAD_MAX_CONCURRENCY}, total 1-{LOAD_MAX_TOTAL}"},
+                            status_code=400)
+    try:
+        mapping_dict = parse_mapping(mapping)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
     job_id = uuid.uuid4().hex[:10]
     jobs[job_id] = {
         "job_id": job_id,
         "url": url,
+        "mode": "load",
         "progress": 0,
-        "steps": [],
+        "steps": StepLog(),
         "artifacts": [],
         "result": "RUNNING",
         "start": time.time(),
+        "form_index": form_index,
     }
-    threading.Thread(target=background_test, args=(job_id, url), daemon=True).start()
+    threading.Thread(target=background_load_test,
+                     args=(job_id, url, form_index, mapping_dict, rate, concurrency, total), daemon=True).start()
     return {"job_id": job_id}
 
 
 @app.get("/job_status")
-def job_status(job_id: str):
+def job_status(job_id: str, compact: bool = False, errors: Optional[str] = None):
+    """
+    Job progress. compact=true returns form_details fields once instead of
+    inline; errors=full adds the full error texts (keyed by step error_id).
+    """
     job = jobs.get(job_id)
     if not job:
         return JSONResponse({"error": "not found"}, status_code=404)
     elapsed = round(time.time() - job.get("start", time.time()), 2)
     progress = job.get("progress", 0)
     eta = round((elapsed / (progress or 1)) * max(0, 100 - progress), 1)
-    return {
+    out = {
         "job_id": job_id,
         "url": job.get("url"),
         "progress": progress,
         "elapsed": elapsed,
         "eta": eta,
         "result": job.get("result"),
-        "steps": job.get("steps", []),
+        "steps": steps_list(job, compact),
         "artifacts": job.get("artifacts", []),
+        "visual": job.get("visual", {}),
+        "perf": job.get("perf"),
+        "load": job.get("load"),
     }
+    steps = job.get("steps")
+    if isinstance(steps, StepLog):
+        out["steps_dropped"] = steps.dropped
+        if errors == "full":
+            out["errors"] = {str(k): v for k, v in steps.errors_snapshot().items()}
+        if compact:
+            out["form_details"] = steps.form_details
+    return out
+
+
+@app.get("/perf_trend")
+def perf_trend(host: str, limit: int = 50):
+    """Per-host performance history recorded by perf-enabled runs"""
+    return {"host": host, "samples": query_perf_trend(host, limit)}
+
+
+@app.get("/visual_baseline")
+def visual_baseline(job_id: str):
+    """Accept a finished job's screenshots as the new visual baseline"""
+    job = jobs.get(job_id)
+    if not job:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    if job.get("result") == "RUNNING":
+        return JSONResponse({"error": "job still running"}, status_code=409)
+    updated = []
+    for tag in ("nav", "after_fill", "after_submit"):
+        local = os.path.join(ARTIFACT_DIR, f"{job_id}_{tag}.png")
+        if accept_baseline(job["url"], job.get("form_index", 0), tag, local):
+            updated.append(tag)
+    return {"job_id": job_id, "updated": updated}
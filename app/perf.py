@@ -0,0 +1,137 @@
+# app/perf.py
+import os
+import time
+from typing import Dict, Any, List, Optional
+
+# Capture target-site performance on every run unless asked per request
+PERF_CAPTURE = os.getenv("PERF_CAPTURE", "0") == "1"
+
+# Registered before navigation; observers are buffered so nothing extra is loaded
+INIT_SCRIPT = """
+(() => {
+  const s = window.__ftPerf = {lcp: 0, cls: 0, inp: 0, interactions: 0};
+  const watch = (opts, fn) => {
+    try { new PerformanceObserver(l => l.getEntries().forEach(fn)).observe(opts); } catch (e) {}
+  };
+  watch({type: 'largest-contentful-paint', buffered: true},
+        e => { s.lcp = e.renderTime || e.loadTime || e.startTime; });
+  watch({type: 'layout-shift', buffered: true},
+        e => { if (!e.hadRecentInput) s.cls += e.value; });
+  watch({type: 'event', buffered: true, durationThreshold: 16},
+        e => { if (e.interactionId) { s.interactions += 1; s.inp = Math.max(s.inp, e.duration); } });
+})();
+"""
+
+COLLECT_JS = """
+() => {
+  const r = (v) => Math.round(v || 0);
+  const nav = performance.getEntriesByType('navigation')[0];
+  const res = performance.getEntriesByType('resource');
+  const byType = {};
+  let bytes = 0;
+  for (const e of res) {
+    byType[e.initiatorType] = (byType[e.initiatorType] || 0) + 1;
+    bytes += e.transferSize || 0;
+  }
+  const v = window.__ftPerf || {};
+  return {
+    navigation: nav ? {
+      ttfb: r(nav.responseStart), dom_content_loaded: r(nav.domContentLoadedEventEnd),
+      load: r(nav.loadEventEnd), transfer_size: nav.transferSize || 0, type: nav.type
+    } : null,
+    vitals: {lcp: r(v.lcp), cls: Math.round((v.cls || 0) * 1000) / 1000, inp: r(v.inp), interactions: v.interactions || 0},
+    resources: {count: res.length, bytes: bytes, by_type: byType}
+  };
+}
+"""
+
+
+# Resolves to "selector" or "text" once the page shows a confirmation
+CONFIRM_JS = """
+([sel, words]) => {
+  if (document.querySelector(sel)) return 'selector';
+  const body = document.body ? document.body.innerText.toLowerCase() : '';
+  return words.some(w => body.includes(w)) ? 'text' : false;
+}
+"""
+
+
+class PerfCapture:
+    """Collects navigation timing, Web Vitals, CDP metrics and submit latency for one page"""
+
+    def __init__(self, page):
+        self.page = page
+        self.data: Dict[str, Any] = {}
+        self._submit_ts: Optional[float] = None
+        page.add_init_script(INIT_SCRIPT)
+        try:
+            self.cdp = page.context.new_cdp_session(page)
+            self.cdp.send("Performance.enable")
+        except Exception:
+            self.cdp = None
+
+    def _cdp_metrics(self) -> Dict[str, float]:
+        if not self.cdp:
+            return {}
+        try:
+            metrics = self.cdp.send("Performance.getMetrics").get("metrics", [])
+            return {m["name"]: m["value"] for m in metrics}
+        except Exception:
+            return {}
+
+    def snapshot(self, phase: str) -> None:
+        """Record page-side metrics for a phase ("load" or "submit")"""
+        try:
+            snap = self.page.evaluate(COLLECT_JS)
+        except Exception as e:
+            snap = {"error": str(e)}
+        snap["cdp"] = self._cdp_metrics()
+        self.data[phase] = snap
+
+    def mark_submit(self) -> None:
+        self._submit_ts = time.perf_counter()
+
+    def wait_for_confirmation(self, selector: str, texts: List[str], timeout_ms: int) -> bool:
+        """
+        Wait up to timeout_ms for the success selector or any success text
+        (the same markers background_test checks), recording
+        submit-to-confirmation latency and which one matched.
+        """
+        try:
+            handle = self.page.wait_for_function(CONFIRM_JS, arg=[selector, texts], timeout=timeout_ms, polling=100)
+            confirmed_at = time.perf_counter()
+            self.data["confirmed_by"] = handle.json_value()
+        except Exception:
+            self.data["submit_latency_ms"] = None
+            self.data["confirmed_by"] = None
+            return False
+        if self._submit_ts is not None:
+            self.data["submit_latency_ms"] = round((confirmed_at - self._submit_ts) * 1000)
+        return True
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Flat numbers used for per-host trends. submit_latency_ms is None when
+        neither the success selector nor a success text appeared within the
+        wait (a confirmation may still arrive later or look different).
+        """
+        load = self.data.get("load", {})
+        submit = self.data.get("submit", {})
+        nav = load.get("navigation") or {}
+        vitals = submit.get("vitals") or load.get("vitals") or {}
+        res = load.get("resources") or {}
+        cdp = load.get("cdp") or {}
+        return {
+            "ttfb": nav.get("ttfb"),
+            "load": nav.get("load"),
+            "lcp": vitals.get("lcp"),
+            "cls": vitals.get("cls"),
+            "inp": vitals.get("inp"),
+            "resources": res.get("count"),
+            "bytes": res.get("bytes"),
+            "js_heap": cdp.get("JSHeapUsedSize"),
+            "submit_latency_ms": self.data.get("submit_latency_ms"),
+        }
+
+    def result(self) -> Dict[str, Any]:
+        return {**self.data, "summary": self.summary()}
@@ -0,0 +1,158 @@
+# app/steps.py
+import os
+import threading
+from collections import deque
+from typing import Dict, List, Any, Optional
+
+# Optional ring-buffer cap for job step logs (0 = unbounded)
+STEP_LOG_MAX = int(os.getenv("STEP_LOG_MAX", 0))
+# Max length of the error text kept inline on each step
+ERROR_SNIPPET_LEN = 200
+
+# Interned action/status strings shared by all jobs
+_codes: Dict[str, int] = {}
+_names: List[str] = []
+_intern_lock = threading.Lock()
+
+
+def _intern(s: Optional[str]) -> int:
+    if s is None:
+        return -1
+    code = _codes.get(s)
+    if code is None:
+        with _intern_lock:
+            code = _codes.get(s)
+            if code is None:
+                code = _codes[s] = len(_names)
+                _names.append(s)
+    return code
+
+
+def _name(code: int) -> Optional[str]:
+    return None if code < 0 else _names[code]
+
+
+def error_snippet(text: str) -> str:
+    """First line of an error, whitespace-collapsed and truncated (drops Playwright's call log)"""
+    first = " ".join(text.strip().split("\n", 1)[0].split())
+    return first if len(first) <= ERROR_SNIPPET_LEN else first[:ERROR_SNIPPET_LEN - 3] + "..."
+
+
+class _Step:
+    __slots__ = ("action", "status", "field", "value", "error", "extra")
+
+    def __init__(self, action, status, field, value, error, extra):
+        self.action = action
+        self.status = status
+        self.field = field
+        self.value = value
+        self.error = error
+        self.extra = extra
+
+
+class StepLog:
+    """
+    Compact per-job step store. Accepts the same dicts as the old list
+    (append/iterate/slice) and serializes back to them via to_list().
+    Errors are de-duplicated on their first line; the full text of the
+    first occurrence is kept in `errors` while a step still references it.
+    The form_details field list is stored once and referenced.
+    Writers (the job thread) and readers (job_status polls) share a
+    per-log lock.
+    """
+
+    def __init__(self, maxlen: Optional[int] = None):
+        maxlen = STEP_LOG_MAX if maxlen is None else maxlen
+        self._steps = deque(maxlen=maxlen or None)
+        self.dropped = 0
+        self.errors: Dict[int, str] = {}        # error_id -> full text
+        self._error_ids: Dict[str, int] = {}    # snippet -> error_id
+        self._error_refs: Dict[int, int] = {}   # error_id -> steps referencing it
+        self._next_error = 0
+        self.form_details: Optional[List[Dict[str, Any]]] = None
+        self._lock = threading.Lock()
+
+    def _error_id(self, text: str) -> int:
+        key = error_snippet(text)
+        eid = self._error_ids.get(key)
+        if eid is None:
+            eid = self._error_ids[key] = self._next_error
+            self._next_error += 1
+            self.errors[eid] = text
+            self._error_refs[eid] = 0
+        self._error_refs[eid] += 1
+        return eid
+
+    def _release_error(self, eid: int) -> None:
+        self._error_refs[eid] -= 1
+        if not self._error_refs[eid]:
+            del self._error_refs[eid]
+            del self._error_ids[error_snippet(self.errors.pop(eid))]
+
+    def append(self, step: Dict[str, Any]) -> None:
+        # Only non-None values go into slots; an explicit None stays in `extra`
+        # so it survives the round trip
+        step = dict(step)
+        action = step.pop("action", None)
+        status = step.pop("status") if step.get("status") is not None else None
+        field = step.pop("field") if step.get("field") is not None else None
+        value = step.pop("value") if step.get("value") is not None else None
+        error = step.pop("error") if step.get("error") is not None else None
+        fields = step.pop("fields") if action == "form_details" and "fields" in step else None
+        if fields is not None:
+            step["fields_ref"] = True
+        action, status = _intern(action), _intern(status)
+        with self._lock:
+            if error is not None:
+                error = self._error_id(str(error))
+            if fields is not None:
+                self.form_details = fields
+            if self._steps.maxlen and len(self._steps) == self._steps.maxlen:
+                self.dropped += 1
+                evicted = self._steps[0]
+                if evicted.error is not None:
+                    self._release_error(evicted.error)
+            self._steps.append(_Step(action, status, field, value, error, step or None))
+
+    def _expand(self, s: _Step, compact: bool = False) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"action": _name(s.action)}
+        if s.status >= 0:
+            out["status"] = _name(s.status)
+        if s.field is not None:
+            out["field"] = s.field
+        if s.value is not None:
+            out["value"] = s.value
+        if s.error is not None:
+            out["error"] = error_snippet(self.errors.get(s.error, ""))
+            out["error_id"] = s.error
+        if s.extra:
+            extra = dict(s.extra)
+            if extra.pop("fields_ref", False):
+                if compact:
+                    extra["fields_ref"] = True
+                else:
+                    extra["fields"] = self.form_details
+            out.update(extra)
+        return out
+
+    def to_list(self, compact: bool = False) -> List[Dict[str, Any]]:
+        """Steps as plain dicts; compact=True leaves form_details fields by reference"""
+        with self._lock:
+            return [self._expand(s, compact) for s in self._steps]
+
+    def errors_snapshot(self) -> Dict[int, str]:
+        """Copy of the full error texts, safe to serialize while the job runs"""
+        with self._lock:
+            return dict(self.errors)
+
+    def __len__(self) -> int:
+        return len(self._steps)
+
+    def __iter__(self):
+        return iter(self.to_list())
+
+    def __getitem__(self, idx):
+        with self._lock:
+            if isinstance(idx, slice):
+                return [self._expand(s) for s in list(self._steps)[idx]]
+            return self._expand(self._steps[idx])
@@ -0,0 +1,167 @@
+# app/visual.py
+import os
+import json
+import hashlib
+import urllib.parse
+from typing import Dict, Any, Optional, Tuple
+
+from app.coalesce import normalize_url
+
+# Optional deps, imported on first use: visual checks are skipped when
+# NumPy/Pillow are missing
+np = None
+Image = None
+VISUAL_AVAILABLE: Optional[bool] = None
+
+ROOT = os.getcwd()
+BASELINE_DIR = os.path.join(ROOT, "baselines")
+ARTIFACT_DIR = os.path.join(ROOT, "artifacts")
+
+VISUAL_DIFF = os.getenv("VISUAL_DIFF", "1") == "1"
+DIFF_WIDTH = int(os.getenv("VISUAL_DIFF_WIDTH", 320))       # downscaled compare width
+PIXEL_THRESHOLD = int(os.getenv("VISUAL_PIXEL_THRESHOLD", 24))  # 0-255 grey delta
+CHANGE_THRESHOLD = float(os.getenv("VISUAL_CHANGE_THRESHOLD", 0.01))  # changed-pixel ratio
+TILE = 16                                                    # tile size (downscaled px)
+TILE_THRESHOLD = float(os.getenv("VISUAL_TILE_THRESHOLD", 0.15))  # changed ratio in any tile
+HEIGHT_TOLERANCE = float(os.getenv("VISUAL_HEIGHT_TOLERANCE", 0.25))  # relative page-height change
+
+
+def _load_deps() -> bool:
+    global np, Image, VISUAL_AVAILABLE
+    if VISUAL_AVAILABLE is None:
+        try:
+            import numpy
+            from PIL import Image as PILImage
+            np, Image = numpy, PILImage
+            VISUAL_AVAILABLE = True
+        except Exception:
+            VISUAL_AVAILABLE = False
+    return VISUAL_AVAILABLE
+
+
+def _safe(s: str) -> str:
+    return "".join(c if c.isalnum() or c in ("-", ".") else "_" for c in s)
+
+
+def baseline_paths(url: str, form_index: int, tag: str) -> Tuple[str, str]:
+    """(png, json) baseline paths for host + page (normalized path/query) + form + screenshot tag"""
+    parts = urllib.parse.urlsplit(normalize_url(url))
+    page = parts.path + ("?" + parts.query if parts.query else "")
+    slug = _safe(page.strip("/") or "root")[:60] + "-" + hashlib.sha1(page.encode("utf-8")).hexdigest()[:8]
+    folder = os.path.join(BASELINE_DIR, _safe(parts.hostname or "site"), slug)
+    stem = os.path.join(folder, f"form{int(form_index)}_{_safe(tag)}")
+    return stem + ".png", stem + ".json"
+
+
+def _load_small(path: str):
+    """Greyscale image downscaled to DIFF_WIDTH, keeping aspect ratio"""
+    with Image.open(path) as im:
+        im = im.convert("L")
+        w, h = im.size
+        height = max(1, round(h * DIFF_WIDTH / w))
+        return im.resize((DIFF_WIDTH, height), Image.BILINEAR), (w, h)
+
+
+def dhash(img) -> int:
+    """64-bit difference hash of a greyscale PIL image"""
+    a = np.asarray(img.resize((9, 8), Image.BILINEAR), dtype=np.int16)
+    bits = (a[:, 1:] > a[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def digest(img) -> str:
+    """Exact digest of the downscaled buffer; any pixel change alters it"""
+    return hashlib.sha1(img.tobytes()).hexdigest()
+
+
+def _save_baseline(small, size, png_path: str, json_path: str) -> int:
+    os.makedirs(os.path.dirname(png_path), exist_ok=True)
+    h = dhash(small)
+    small.save(png_path)
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump({"hash": h, "digest": digest(small), "size": list(size)}, f)
+    return h
+
+
+def _pad(a, height: int):
+    """Pad a greyscale array with white rows up to height"""
+    if a.shape[0] >= height:
+        return a
+    return np.pad(a, ((0, height - a.shape[0]), (0, 0)), constant_values=255)
+
+
+def _max_tile_score(mask) -> float:
+    """Highest changed-pixel ratio over TILE x TILE tiles, so local changes aren't diluted"""
+    h, w = mask.shape
+    m = np.pad(mask, ((0, -h % TILE), (0, -w % TILE)))
+    tiles = m.reshape(m.shape[0] // TILE, TILE, m.shape[1] // TILE, TILE).mean(axis=(1, 3))
+    return float(tiles.max())
+
+
+def compare_screenshot(job_id: str, url: str, form_index: int, tag: str, shot_path: str) -> Optional[Dict[str, Any]]:
+    """
+    Compare a screenshot with the page/form baseline. Creates the baseline on
+    first run; exits early when the downscaled buffers are identical.
+    Small page-height drift (lazy images, banners) is only reported via
+    size_changed; a relative height change above HEIGHT_TOLERANCE counts as
+    changed. The dHash distance is reported as a secondary signal.
+    """
+    if not (VISUAL_DIFF and _load_deps()):
+        return None
+    png_path, json_path = baseline_paths(url, form_index, tag)
+    small, size = _load_small(shot_path)
+
+    if not (os.path.exists(png_path) and os.path.exists(json_path)):
+        _save_baseline(small, size, png_path, json_path)
+        return {"tag": tag, "status": "baseline_created", "score": 0.0}
+
+    with open(json_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    size_changed = list(size) != list(meta.get("size", []))
+    if not size_changed and meta.get("digest") == digest(small):
+        return {"tag": tag, "status": "match", "score": 0.0, "hash_distance": 0}
+    distance = bin(dhash(small) ^ int(meta["hash"])).count("1")
+
+    with Image.open(png_path) as base_img:
+        base = np.asarray(base_img.convert("L"), dtype=np.int16)
+    cur = np.asarray(small, dtype=np.int16)
+    if cur.shape[1] != base.shape[1]:
+        # DIFF_WIDTH changed since the baseline was taken
+        cur = np.asarray(small.resize((base.shape[1], cur.shape[0]), Image.BILINEAR), dtype=np.int16)
+    # Pad rather than stretch, so content added/removed shows up as changed rows
+    height = max(cur.shape[0], base.shape[0])
+    cur, base = _pad(cur, height), _pad(base, height)
+    mask = np.abs(cur - base) > PIXEL_THRESHOLD
+    score = round(float(mask.mean()), 5)
+    tile_score = round(_max_tile_score(mask), 3)
+
+    base_h = (meta.get("size") or [0, 0])[1] or size[1]
+    height_change = round(abs(size[1] - base_h) / base_h, 3)
+
+    changed = score > CHANGE_THRESHOLD or tile_score > TILE_THRESHOLD or height_change > HEIGHT_TOLERANCE
+    result = {
+        "tag": tag,
+        "status": "changed" if changed else "ok",
+        "score": score,
+        "tile_score": tile_score,
+        "hash_distance": distance,
+        "size_changed": size_changed,
+        "height_change": height_change,
+    }
+    if mask.any():
+        rgb = np.repeat(cur.astype(np.uint8)[:, :, None], 3, axis=2)
+        rgb[mask] = (255, 0, 0)
+        fname = f"{job_id}_{_safe(tag)}_diff.png"
+        Image.fromarray(rgb).save(os.path.join(ARTIFACT_DIR, fname))
+        result["diff"] = f"/artifacts/{fname}"
+    return result
+
+
+def accept_baseline(url: str, form_index: int, tag: str, shot_path: str) -> bool:
+    """Replace the baseline for url/form/tag with the given screenshot"""
+    if not _load_deps() or not os.path.exists(shot_path):
+        return False
+    png_path, json_path = baseline_paths(url, form_index, tag)
+    small, size = _load_small(shot_path)
+    _save_baseline(small, size, png_path, json_path)
+    return True
@@ -0,0 +1,40 @@
+# bench_startup.py
+# Measures API cold-start cost: `import app.main` in a fresh interpreter and
+# the browser warm-up that gates /ready.
+#   python bench_startup.py [runs]
+import sys, time, subprocess, statistics
+
+IMPORT_SNIPPET = "import time; t=time.perf_counter(); import app.main; print(time.perf_counter()-t)"
+
+
+def bench_import(runs: int):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True)
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def bench_warm_up():
+    from app.main import warm_up, warm_state
+    t = time.perf_counter()
+    warm_up()
+    return time.perf_counter() - t, warm_state
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    samples = bench_import(runs)
+    print(f"import app.main: median {statistics.median(samples)*1000:.1f} ms, "
+          f"min {min(samples)*1000:.1f} ms, max {max(samples)*1000:.1f} ms ({runs} runs)")
+    if "playwright" in subprocess.run(
+        [sys.executable, "-c", "import sys, app.main; print(' '.join(sys.modules))"],
+        capture_output=True, text=True, check=True,
+    ).stdout.split():
+        print("WARNING: playwright is imported eagerly by app.main")
+    elapsed, state = bench_warm_up()
+    print(f"warm-up to ready: {elapsed:.2f} s (ready={state['ready']}, error={state['error']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
 # create_db.py
 import sqlite3, os
 
+from app.db_utils import PERF_DDL
+
 # The database file will be created in your current directory
 DB_PATH = os.path.join(os.getcwd(), "jobs.db")
 
@@ -24,7 +26,7 @@ CREATE TABLE IF NOT EXISTS schedules (
     cron_expr TEXT,
     created_at TEXT
 );
-"""
+""" + PERF_DDL
 
 def main():
     print("Creating SQLite database at:", DB_PATH)
@@ -0,0 +1,59 @@
+# loadtest_local.py
+# Replays a fake Contact Form 7 submission against a local stand-in server,
+# so the load mode can be checked without a browser or a real site.
+#   python loadtest_local.py [rate] [concurrency] [total]
+import sys, json, base64, asyncio, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from app.loadtest import replay, nonce_fields
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1  # send headers and body in one write (avoids delayed-ACK stalls)
+    received = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        StandIn.received += 1
+        # every 10th submission is rejected the way CF7 does it: HTTP 200 + status
+        status = "spam" if StandIn.received % 10 == 0 else "mail_sent"
+        body = json.dumps({"status": status}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *_):
+        pass
+
+
+def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    total = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/wp-json/contact-form-7/v1/contact-forms/5/feedback"
+
+    body = b"_wpcf7=5&_wpcf7_unit_tag=wpcf7-f5-o1&your-name=Test+User&your-email=test%40example.com"
+    ctype = "application/x-www-form-urlencoded"
+    captured = {
+        "method": "POST",
+        "url": url,
+        "headers": {"content-type": ctype},
+        "body_b64": base64.b64encode(body).decode("ascii"),
+        "nonce_fields": nonce_fields(body, ctype),
+    }
+    print("nonce fields:", captured["nonce_fields"])
+
+    report = asyncio.run(replay(captured, rate, concurrency, total))
+    server.shutdown()
+    print(json.dumps(report, indent=2))
+    print("server received:", StandIn.received)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
 #!/usr/bin/env bash
 set -euo pipefail
 
-echo ">>> Installing Python dependencies..."
-pip install -r requirements.txt
-
 # Make sure Playwright browsers are available
 export PLAYWRIGHT_BROWSERS_PATH=/opt/render/.cache/ms-playwright
-echo ">>> Installing Playwright Chromium browser..."
-python -m playwright install chromium
+
+# Images that already bake in deps/browsers can set SKIP_INSTALL=1 to boot faster
+if [ "${SKIP_INSTALL:-0}" != "1" ]; then
+  echo ">>> Installing Python dependencies..."
+  pip install -r requirements.txt
+
+  echo ">>> Installing Playwright Chromium browser..."
+  python -m playwright install chromium
+fi
 
 # Run your FastAPI app
 PORT=${PORT:-10000}